@@ -0,0 +1,44 @@
+import copy
+import pathlib
+
+import pytest
+
+from transformer_srl import utils
+
+RESOURCE_PATH = pathlib.Path(__file__).resolve().parent.parent / "transformer_srl" / "resources"
+
+
+def test_loaded_dictionaries_are_deepcopyable():
+    # quantize_for_inference deep-copies the model, dictionaries included
+    lemma_frame = utils.load_lemma_frame(RESOURCE_PATH / "lemma2frame.csv")
+    frame_role = utils.load_role_frame(RESOURCE_PATH / "frame2role.csv")
+    assert copy.deepcopy(lemma_frame) == lemma_frame
+    assert copy.deepcopy(frame_role) == frame_role
+
+
+def test_quantize_for_inference_smoke(monkeypatch):
+    pytest.importorskip("allennlp_models")
+    from concurrent.futures import ThreadPoolExecutor
+
+    from allennlp.data import Vocabulary
+    from transformers import BertConfig, BertModel
+
+    from transformer_srl import models
+
+    config = BertConfig(
+        hidden_size=32,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=37,
+        vocab_size=50,
+    )
+    monkeypatch.setattr(models.AutoModel, "from_pretrained", lambda name: BertModel(config))
+    vocab = Vocabulary()
+    vocab.add_tokens_to_namespace(["O", "B-ARG0", "I-ARG0"], "labels")
+    model = models.TransformerSrlSpan(vocab, bert_model="unused", srl_eval_path=None)
+    # simulate the state after an eval pass: the lazily-created executor
+    # must not break the deepcopy inside quantize_dynamic
+    model._metric_executor = ThreadPoolExecutor(max_workers=1)
+    quantized = model.quantize_for_inference()
+    assert quantized is not model
+    assert quantized._metric_executor is None
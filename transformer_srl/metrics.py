@@ -0,0 +1,90 @@
+import torch
+import torch.distributed as dist
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.util import is_distributed
+from allennlp.training.metrics.fbeta_measure import FBetaMeasure
+from overrides import overrides
+
+
+class MicroFBetaMeasure(FBetaMeasure):
+    """
+    Micro-averaged drop-in replacement for `FBetaMeasure` that keeps its
+    true-positive / predicted / gold counters on the device of the predictions
+    and updates them with `scatter_add_`, instead of building one-hot style
+    histograms per call. Nothing is moved to CPU until `get_metric` is read;
+    in distributed runs the counters are also all-reduced there, once per
+    read instead of once per call.
+    """
+
+    def __init__(self, beta: float = 1.0) -> None:
+        super().__init__(beta=beta, average="micro")
+
+    @overrides
+    def __call__(
+        self,
+        predictions: torch.Tensor,
+        gold_labels: torch.Tensor,
+        mask: torch.Tensor = None,
+    ):
+        num_classes = predictions.size(-1)
+        if (gold_labels >= num_classes).any():
+            raise ConfigurationError(
+                "A gold label passed to MicroFBetaMeasure contains "
+                f"an id >= {num_classes}, the number of classes."
+            )
+        predictions = predictions.detach().view(-1, num_classes)
+        gold_labels = gold_labels.detach().view(-1)
+        if mask is not None:
+            mask = mask.view(-1).bool()
+            predictions = predictions[mask]
+            gold_labels = gold_labels[mask]
+
+        if self._true_positive_sum is None:
+            device = predictions.device
+            self._true_positive_sum = torch.zeros(num_classes, device=device)
+            self._pred_sum = torch.zeros(num_classes, device=device)
+            self._true_sum = torch.zeros(num_classes, device=device)
+            self._total_sum = torch.zeros(num_classes, device=device)
+
+        if gold_labels.numel() == 0:
+            return
+        pred_labels = predictions.argmax(dim=-1)
+        ones = torch.ones_like(gold_labels, dtype=torch.float)
+        self._pred_sum.scatter_add_(0, pred_labels, ones)
+        self._true_sum.scatter_add_(0, gold_labels, ones)
+        self._total_sum.scatter_add_(0, gold_labels, ones)
+        correct_labels = gold_labels[pred_labels == gold_labels]
+        self._true_positive_sum.scatter_add_(
+            0, correct_labels, torch.ones_like(correct_labels, dtype=torch.float)
+        )
+
+    @overrides
+    def get_metric(self, reset: bool = False):
+        if is_distributed() and self._true_positive_sum is not None:
+            # all-reduce a stacked copy so that repeated non-reset reads do
+            # not keep re-summing the local counters across ranks
+            local_sums = (
+                self._true_positive_sum,
+                self._pred_sum,
+                self._true_sum,
+                self._total_sum,
+            )
+            reduced = torch.stack(local_sums)
+            dist.all_reduce(reduced, op=dist.ReduceOp.SUM)
+            (
+                self._true_positive_sum,
+                self._pred_sum,
+                self._true_sum,
+                self._total_sum,
+            ) = reduced
+            try:
+                return super().get_metric(reset=reset)
+            finally:
+                if not reset:
+                    (
+                        self._true_positive_sum,
+                        self._pred_sum,
+                        self._true_sum,
+                        self._total_sum,
+                    ) = local_sums
+        return super().get_metric(reset=reset)
@@ -1,580 +1,1065 @@
-import pathlib
-from typing import Any, Dict, List, Union
-
-import numpy as np
-import torch
-import torch.nn.functional as F
-from allennlp.data import TextFieldTensors, Vocabulary
-from allennlp.models.model import Model
-from allennlp.modules import Seq2SeqEncoder
-from allennlp.nn import InitializerApplicator, util
-from allennlp.nn.util import get_device_of, get_text_field_mask, sequence_cross_entropy_with_logits
-from allennlp.training.metrics.fbeta_measure import FBetaMeasure
-from allennlp_models.structured_prediction import SrlBert
-from allennlp_models.structured_prediction.metrics.srl_eval_scorer import (
-    DEFAULT_SRL_EVAL_PATH,
-    SrlEvalScorer,
-)
-from overrides import overrides
-from torch import nn
-from transformers import AutoModel
-from transformers.tokenization_auto import AutoConfig
-
-from transformer_srl.utils import load_label_list, load_lemma_frame, load_role_frame
-
-LEMMA_FRAME_PATH = pathlib.Path(__file__).resolve().parent / "resources" / "lemma2frame.csv"
-FRAME_ROLE_PATH = pathlib.Path(__file__).resolve().parent / "resources" / "frame2role.csv"
-FRAME_LIST_PATH = pathlib.Path(__file__).resolve().parent / "resources" / "framelist.txt"
-
-
-@Model.register("transformer_srl_span")
-class TransformerSrlSpan(SrlBert):
-    """
-
-    # Parameters
-
-    vocab : `Vocabulary`, required
-        A Vocabulary, required in order to compute sizes for input/output projections.
-    model : `Union[str, AutoModel]`, required.
-        A string describing the BERT model to load or an already constructed AutoModel.
-    initializer : `InitializerApplicator`, optional (default=`InitializerApplicator()`)
-        Used to initialize the model parameters.
-    label_smoothing : `float`, optional (default = `0.0`)
-        Whether or not to use label smoothing on the labels when computing cross entropy loss.
-    ignore_span_metric : `bool`, optional (default = `False`)
-        Whether to calculate span loss, which is irrelevant when predicting BIO for Open Information Extraction.
-    srl_eval_path : `str`, optional (default=`DEFAULT_SRL_EVAL_PATH`)
-        The path to the srl-eval.pl script. By default, will use the srl-eval.pl included with allennlp,
-        which is located at allennlp/tools/srl-eval.pl . If `None`, srl-eval.pl is not used.
-    """
-
-    def __init__(
-        self,
-        vocab: Vocabulary,
-        bert_model: Union[str, AutoModel],
-        embedding_dropout: float = 0.0,
-        initializer: InitializerApplicator = InitializerApplicator(),
-        label_smoothing: float = None,
-        ignore_span_metric: bool = False,
-        srl_eval_path: str = DEFAULT_SRL_EVAL_PATH,
-        restrict_frames: bool = False,
-        restrict_roles: bool = False,
-        inventory: str = "verbatlas",
-        **kwargs,
-    ) -> None:
-        # bypass SrlBert constructor
-        Model.__init__(self, vocab, **kwargs)
-        self.lemma_frame_dict = load_lemma_frame(LEMMA_FRAME_PATH)
-        self.frame_role_dict = load_role_frame(FRAME_ROLE_PATH)
-        self.restrict_frames = restrict_frames
-        self.restrict_roles = restrict_roles
-        self.transformer = AutoModel.from_pretrained(bert_model)
-        self.frame_criterion = nn.CrossEntropyLoss()
-        if inventory == "verbatlas":
-            # add missing labels
-            frame_list = load_label_list(FRAME_LIST_PATH)
-            self.vocab.add_tokens_to_namespace(frame_list, "frames_labels")
-        self.num_classes = self.vocab.get_vocab_size("labels")
-        self.frame_num_classes = self.vocab.get_vocab_size("frames_labels")
-        if srl_eval_path is not None:
-            # For the span based evaluation, we don't want to consider labels
-            # for verb, because the verb index is provided to the model.
-            self.span_metric = SrlEvalScorer(srl_eval_path, ignore_classes=["V"])
-        else:
-            self.span_metric = None
-        self.f1_frame_metric = FBetaMeasure(average="micro")
-        self.tag_projection_layer = nn.Linear(self.transformer.config.hidden_size, self.num_classes)
-        self.frame_projection_layer = nn.Linear(
-            self.transformer.config.hidden_size, self.frame_num_classes
-        )
-        self.embedding_dropout = nn.Dropout(p=embedding_dropout)
-        self._label_smoothing = label_smoothing
-        self.ignore_span_metric = ignore_span_metric
-        initializer(self)
-
-    def forward(  # type: ignore
-        self,
-        tokens: TextFieldTensors,
-        verb_indicator: torch.Tensor,
-        frame_indicator: torch.Tensor,
-        metadata: List[Any],
-        tags: torch.LongTensor = None,
-        frame_tags: torch.LongTensor = None,
-    ):
-
-        """
-        # Parameters
-
-        tokens : `TextFieldTensors`, required
-            The output of `TextField.as_array()`, which should typically be passed directly to a
-            `TextFieldEmbedder`. For this model, this must be a `SingleIdTokenIndexer` which
-            indexes wordpieces from the BERT vocabulary.
-        verb_indicator: `torch.LongTensor`, required.
-            An integer `SequenceFeatureField` representation of the position of the verb
-            in the sentence. This should have shape (batch_size, num_tokens) and importantly, can be
-            all zeros, in the case that the sentence has no verbal predicate.
-        frame_indicator: torch.LongTensor, required.
-            An integer ``SequenceFeatureField`` representation of the position of the frame
-            in the sentence. This should have shape (batch_size, num_tokens). Similar to verb_indicator,
-            but handles bert wordpiece tokenizer by cosnidering a frame only the first subtoken.
-        tags : `torch.LongTensor`, optional (default = `None`)
-            A torch tensor representing the sequence of integer gold class labels
-            of shape `(batch_size, num_tokens)`
-        frame_tags : torch.LongTensor, optional (default = None)
-            A torch tensor representing the gold frames
-            of shape ``(batch_size, num_tokens)``
-        metadata : `List[Dict[str, Any]]`, optional, (default = `None`)
-            metadata containg the original words in the sentence, the verb to compute the
-            frame for, and start offsets for converting wordpieces back to a sequence of words,
-            under 'words', 'verb' and 'offsets' keys, respectively.
-
-        # Returns
-
-        An output dictionary consisting of:
-        logits : `torch.FloatTensor`
-            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
-            unnormalised log probabilities of the tag classes.
-        class_probabilities : `torch.FloatTensor`
-            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
-            a distribution of the tag classes per word.
-        loss : `torch.FloatTensor`, optional
-            A scalar loss to be optimised.
-        """
-        mask = get_text_field_mask(tokens)
-        input_ids = util.get_token_ids_from_text_field_tensors(tokens)
-        bert_embeddings, _ = self.transformer(
-            input_ids=input_ids, token_type_ids=verb_indicator, attention_mask=mask,
-        )
-        # extract embeddings
-        embedded_text_input = self.embedding_dropout(bert_embeddings)
-        frame_embeddings = embedded_text_input[frame_indicator == 1]
-        # get sizes
-        batch_size, sequence_length, _ = embedded_text_input.size()
-        # outputs
-        logits = self.tag_projection_layer(embedded_text_input)
-        frame_logits = self.frame_projection_layer(frame_embeddings)
-
-        reshaped_log_probs = logits.view(-1, self.num_classes)
-        class_probabilities = F.softmax(reshaped_log_probs, dim=-1).view(
-            [batch_size, sequence_length, self.num_classes]
-        )
-
-        frame_probabilities = F.softmax(frame_logits, dim=-1)
-        # We need to retain the mask in the output dictionary
-        # so that we can crop the sequences to remove padding
-        # when we do viterbi inference in self.make_output_human_readable.
-        output_dict = {
-            "logits": logits,
-            "frame_logits": frame_logits,
-            "class_probabilities": class_probabilities,
-            "frame_probabilities": frame_probabilities,
-            "mask": mask,
-        }
-        # We add in the offsets here so we can compute the un-wordpieced tags.
-        words, verbs, offsets = zip(*[(x["words"], x["verb"], x["offsets"]) for x in metadata])
-        lemmas = [l for x in metadata for l in x["lemmas"]]
-        output_dict["words"] = list(words)
-        output_dict["lemma"] = list(lemmas)
-        output_dict["verb"] = list(verbs)
-        output_dict["wordpiece_offsets"] = list(offsets)
-
-        if tags is not None:
-            # compute role loss
-            role_loss = sequence_cross_entropy_with_logits(
-                logits, tags, mask, label_smoothing=self._label_smoothing
-            )
-            # compute frame loss
-            frame_tags_filtered = frame_tags[frame_indicator == 1]
-            frame_loss = self.frame_criterion(frame_logits, frame_tags_filtered)
-            if not self.ignore_span_metric and self.span_metric is not None and not self.training:
-                batch_verb_indices = [
-                    example_metadata["verb_index"] for example_metadata in metadata
-                ]
-                batch_sentences = [example_metadata["words"] for example_metadata in metadata]
-                # Get the BIO tags from make_output_human_readable()
-                batch_bio_predicted_tags = self.make_output_human_readable(output_dict).pop("tags")
-                from allennlp_models.structured_prediction.models.srl import (
-                    convert_bio_tags_to_conll_format,
-                )
-
-                batch_conll_predicted_tags = [
-                    convert_bio_tags_to_conll_format(tags) for tags in batch_bio_predicted_tags
-                ]
-                batch_bio_gold_tags = [
-                    example_metadata["gold_tags"] for example_metadata in metadata
-                ]
-                batch_conll_gold_tags = [
-                    convert_bio_tags_to_conll_format(tags) for tags in batch_bio_gold_tags
-                ]
-                self.span_metric(
-                    batch_verb_indices,
-                    batch_sentences,
-                    batch_conll_predicted_tags,
-                    batch_conll_gold_tags,
-                )
-            self.f1_frame_metric(frame_logits, frame_tags_filtered)
-            output_dict["frame_loss"] = frame_loss
-            output_dict["role_loss"] = role_loss
-            output_dict["loss"] = (role_loss + frame_loss) / 2
-        return output_dict
-
-    def decode_frames(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        # frame prediction
-        frame_probabilities = output_dict["frame_probabilities"]
-        if self.restrict_frames:
-            frame_probabilities = frame_probabilities.cpu().data.numpy()
-            lemmas = output_dict["lemma"]
-            candidate_labels = [self.lemma_frame_dict.get(l, []) for l in lemmas]
-            # clear candidates from unknowns
-            label_set = set(k for k in self._get_label_tokens("frames_labels"))
-            candidate_labels_ids = [
-                [
-                    self.vocab.get_token_index(l, namespace="frames_labels")
-                    for l in cl
-                    if l in label_set
-                ]
-                for cl in candidate_labels
-            ]
-
-            frame_predictions = []
-            for cl, fp in zip(candidate_labels_ids, frame_probabilities):
-                # restrict candidates from verbatlas inventory
-                fp_candidates = np.take(fp, cl)
-                if fp_candidates.size > 0:
-                    frame_predictions.append(cl[fp_candidates.argmax(axis=-1)])
-                else:
-                    frame_predictions.append(fp.argmax(axis=-1))
-        else:
-            frame_predictions = frame_probabilities.argmax(dim=-1).cpu().data.numpy()
-
-        output_dict["frame_tags"] = [
-            self.vocab.get_token_from_index(f, namespace="frames_labels") for f in frame_predictions
-        ]
-        output_dict["frame_scores"] = [
-            fp[f] for f, fp in zip(frame_predictions, frame_probabilities)
-        ]
-        return output_dict
-
-    @overrides
-    def make_output_human_readable(
-        self, output_dict: Dict[str, torch.Tensor]
-    ) -> Dict[str, torch.Tensor]:
-        output_dict = self.decode_frames(output_dict)
-        if self.restrict_roles:
-            output_dict = self._mask_args(output_dict)
-        output_dict = super().make_output_human_readable(output_dict)
-        return output_dict
-
-    def _mask_args(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        class_probs = output_dict["class_probabilities"]
-        device = get_device_of(class_probs)
-        lemmas = output_dict["lemma"]
-        frames = output_dict["frame_tags"]
-        candidate_mask = torch.ones_like(class_probs, dtype=torch.bool).to(device)
-        for i, (l, f) in enumerate(zip(lemmas, frames)):
-            candidates = self.frame_role_dict.get((l, f), [])
-            if candidates:
-                canidate_ids = [
-                    self.vocab.get_token_index(r, namespace="labels") for r in candidates
-                ]
-                canidate_ids = torch.tensor(canidate_ids).to(device)
-                canidate_ids = canidate_ids.repeat(candidate_mask.shape[1], 1)
-                candidate_mask[i].scatter_(1, canidate_ids, False)
-            else:
-                candidate_mask[i].fill_(False)
-        class_probs.masked_fill_(candidate_mask, 0)
-        return output_dict
-
-    @overrides
-    def get_metrics(self, reset: bool = False):
-        if self.ignore_span_metric:
-            # Return an empty dictionary if ignoring the
-            # span metric
-            return {}
-
-        else:
-            metric_dict = self.span_metric.get_metric(reset=reset)
-            frame_metric_dict = self.f1_frame_metric.get_metric(reset=reset)
-            # This can be a lot of metrics, as there are 3 per class.
-            # we only really care about the overall metrics, so we filter for them here.
-            metric_dict_filtered = {
-                x.split("-")[0] + "_role": y
-                for x, y in metric_dict.items()
-                if "overall" in x and "f1" in x
-            }
-            frame_metric_dict = {
-                x + "_frame": y for x, y in frame_metric_dict.items() if "fscore" in x
-            }
-            return {**metric_dict_filtered, **frame_metric_dict}
-
-    def _get_label_tokens(self, namespace: str = "labels"):
-        return self.vocab.get_token_to_index_vocabulary(namespace).keys()
-
-    def _get_label_ids(self, namespace: str = "labels"):
-        return self.vocab.get_index_to_token_vocabulary(namespace).keys()
-
-    default_predictor = "transformer_srl"
-
-
-@Model.register("transformer_srl_dependency")
-class TransformerSrlDependency(Model):
-    """
-
-    # Parameters
-
-    vocab : `Vocabulary`, required
-        A Vocabulary, required in order to compute sizes for input/output projections.
-    model : `Union[str, AutoModel]`, required.
-        A string describing the BERT model to load or an already constructed AutoModel.
-    initializer : `InitializerApplicator`, optional (default=`InitializerApplicator()`)
-        Used to initialize the model parameters.
-    label_smoothing : `float`, optional (default = `0.0`)
-        Whether or not to use label smoothing on the labels when computing cross entropy loss.
-    ignore_span_metric : `bool`, optional (default = `False`)
-        Whether to calculate span loss, which is irrelevant when predicting BIO for Open Information Extraction.
-    srl_eval_path : `str`, optional (default=`DEFAULT_SRL_EVAL_PATH`)
-        The path to the srl-eval.pl script. By default, will use the srl-eval.pl included with allennlp,
-        which is located at allennlp/tools/srl-eval.pl . If `None`, srl-eval.pl is not used.
-    """
-
-    def __init__(
-        self,
-        vocab: Vocabulary,
-        model_name: Union[str, AutoModel],
-        embedding_dropout: float = 0.0,
-        initializer: InitializerApplicator = InitializerApplicator(),
-        label_smoothing: float = None,
-        ignore_span_metric: bool = False,
-        srl_eval_path: str = DEFAULT_SRL_EVAL_PATH,
-        restrict_frames: bool = False,
-        restrict_roles: bool = False,
-        **kwargs,
-    ) -> None:
-        # bypass SrlBert constructor
-        Model.__init__(self, vocab, **kwargs)
-        self.lemma_frame_dict = load_lemma_frame(LEMMA_FRAME_PATH)
-        self.frame_role_dict = load_role_frame(FRAME_ROLE_PATH)
-        self.restrict_frames = restrict_frames
-        self.restrict_roles = restrict_roles
-
-        if isinstance(model_name, str):
-            self.transformer = AutoModel.from_pretrained(model_name)
-        else:
-            self.transformer = model_name
-        # loss
-        self.role_criterion = nn.CrossEntropyLoss(ignore_index=0)
-        self.frame_criterion = nn.CrossEntropyLoss()
-        # number of classes
-        self.num_classes = self.vocab.get_vocab_size("labels")
-        self.frame_num_classes = self.vocab.get_vocab_size("frames_labels")
-        # metrics
-        role_set = self.vocab.get_token_to_index_vocabulary("labels")
-        role_set_filter = [v for k, v in role_set.items() if k != "O"]
-        self.f1_role_metric = FBetaMeasure(average="micro", labels=role_set_filter)
-        self.f1_frame_metric = FBetaMeasure(average="micro")
-        # output layer
-        self.tag_projection_layer = nn.Linear(self.transformer.config.hidden_size, self.num_classes)
-        self.frame_projection_layer = nn.Linear(
-            self.transformer.config.hidden_size, self.frame_num_classes
-        )
-        self.embedding_dropout = nn.Dropout(p=embedding_dropout)
-        self._label_smoothing = label_smoothing
-        initializer(self)
-
-    def forward(  # type: ignore
-        self,
-        tokens: TextFieldTensors,
-        verb_indicator: torch.Tensor,
-        frame_indicator: torch.Tensor,
-        metadata: List[Any],
-        tags: torch.LongTensor = None,
-        frame_tags: torch.LongTensor = None,
-    ):
-
-        """
-        # Parameters
-
-        tokens : `TextFieldTensors`, required
-            The output of `TextField.as_array()`, which should typically be passed directly to a
-            `TextFieldEmbedder`. For this model, this must be a `SingleIdTokenIndexer` which
-            indexes wordpieces from the BERT vocabulary.
-        verb_indicator: `torch.LongTensor`, required.
-            An integer `SequenceFeatureField` representation of the position of the verb
-            in the sentence. This should have shape (batch_size, num_tokens) and importantly, can be
-            all zeros, in the case that the sentence has no verbal predicate.
-        tags : `torch.LongTensor`, optional (default = `None`)
-            A torch tensor representing the sequence of integer gold class labels
-            of shape `(batch_size, num_tokens)`
-        frame_tags : torch.LongTensor, optional (default = None)
-            A torch tensor representing the gold frames
-            of shape ``(batch_size, num_tokens)``
-        metadata : `List[Dict[str, Any]]`, optional, (default = `None`)
-            metadata containg the original words in the sentence, the verb to compute the
-            frame for, and start offsets for converting wordpieces back to a sequence of words,
-            under 'words', 'verb' and 'offsets' keys, respectively.
-
-        # Returns
-
-        An output dictionary consisting of:
-        logits : `torch.FloatTensor`
-            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
-            unnormalised log probabilities of the tag classes.
-        class_probabilities : `torch.FloatTensor`
-            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
-            a distribution of the tag classes per word.
-        loss : `torch.FloatTensor`, optional
-            A scalar loss to be optimised.
-        """
-        mask = get_text_field_mask(tokens)
-        bert_embeddings, _ = self.transformer(
-            input_ids=util.get_token_ids_from_text_field_tensors(tokens),
-            token_type_ids=verb_indicator,
-            attention_mask=mask,
-        )
-
-        # extract embeddings
-        embedded_text_input = self.embedding_dropout(bert_embeddings)
-        frame_embeddings = embedded_text_input[frame_indicator == 1]
-        # get sizes
-        batch_size, sequence_length, _ = embedded_text_input.size()
-        # outputs
-        logits = self.tag_projection_layer(embedded_text_input)
-        frame_logits = self.frame_projection_layer(frame_embeddings)
-
-        reshaped_log_probs = logits.view(-1, self.num_classes)
-        role_probabilities = F.softmax(reshaped_log_probs, dim=-1).view(
-            [batch_size, sequence_length, self.num_classes]
-        )
-        frame_probabilities = F.softmax(frame_logits, dim=-1)
-        # We need to retain the mask in the output dictionary
-        # so that we can crop the sequences to remove padding
-        # when we do viterbi inference in self.make_output_human_readable.
-        output_dict = {
-            "logits": logits,
-            "frame_logits": frame_logits,
-            "role_probabilities": role_probabilities,
-            "frame_probabilities": frame_probabilities,
-            "mask": mask,
-        }
-        # We add in the offsets here so we can compute the un-wordpieced tags.
-        words, verbs = zip(*[(x["words"], x["verb"]) for x in metadata])
-        lemmas = [l for x in metadata for l in x["lemmas"]]
-        output_dict["words"] = list(words)
-        output_dict["verb"] = list(verbs)
-        output_dict["lemma"] = list(lemmas)
-
-        if tags is not None:
-            # compute role loss
-            # role_loss = sequence_cross_entropy_with_logits(
-            #     logits, tags, mask, label_smoothing=self._label_smoothing
-            # )
-            role_loss = self.role_criterion(logits.view(-1, self.num_classes), tags.view(-1))
-            # compute frame loss
-            frame_tags_filtered = frame_tags[frame_indicator == 1]
-            frame_loss = self.frame_criterion(frame_logits, frame_tags_filtered)
-
-            self.f1_role_metric(role_probabilities, tags)
-            self.f1_frame_metric(frame_logits, frame_tags_filtered)
-
-            output_dict["frame_loss"] = frame_loss
-            output_dict["role_loss"] = role_loss
-            output_dict["loss"] = (role_loss + frame_loss) / 2
-        return output_dict
-
-    def decode_frames(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        # frame prediction
-        frame_probabilities = output_dict["frame_probabilities"]
-        if self.restrict:
-            frame_probabilities = frame_probabilities.cpu().data.numpy()
-            lemmas = output_dict["lemma"]
-            candidate_labels = [self.lemma_frame_dict.get(l, []) for l in lemmas]
-            # clear candidates from unknowns
-            label_set = set(k for k in self._get_label_tokens("frames_labels"))
-            candidate_labels_ids = [
-                [
-                    self.vocab.get_token_index(l, namespace="frames_labels")
-                    for l in cl
-                    if l in label_set
-                ]
-                for cl in candidate_labels
-            ]
-
-            frame_predictions = []
-            for cl, fp in zip(candidate_labels_ids, frame_probabilities):
-                # restrict candidates from verbatlas inventory
-                fp_candidates = np.take(fp, cl)
-                if fp_candidates.size > 0:
-                    frame_predictions.append(cl[fp_candidates.argmax(axis=-1)])
-                else:
-                    frame_predictions.append(fp.argmax(axis=-1))
-        else:
-            frame_predictions = frame_probabilities.argmax(dim=-1).cpu().data.numpy()
-
-        output_dict["frame_tags"] = [
-            self.vocab.get_token_from_index(f, namespace="frames_labels") for f in frame_predictions
-        ]
-        output_dict["frame_scores"] = [
-            fp[f] for f, fp in zip(frame_predictions, frame_probabilities)
-        ]
-        return output_dict
-
-    @overrides
-    def make_output_human_readable(
-        self, output_dict: Dict[str, torch.Tensor], restrict: bool = True
-    ) -> Dict[str, torch.Tensor]:
-        output_dict = self.decode_frames(output_dict)
-        # if self.restrict:
-        #     output_dict = self._mask_args(output_dict)
-        # output_dict = super().make_output_human_readable(output_dict)
-        roles_probabilities = output_dict["role_probabilities"]
-        roles_predictions = roles_probabilities.argmax(dim=-1).cpu().data.numpy()
-
-        output_dict["tags"] = [
-            [self.vocab.get_token_from_index(r, namespace="labels") for r in roles]
-            for roles in roles_predictions
-        ]
-        return output_dict
-
-    def _mask_args(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        class_probs = output_dict["class_probabilities"]
-        device = get_device_of(class_probs)
-        lemmas = output_dict["lemma"]
-        frames = output_dict["frame_tags"]
-        candidate_mask = torch.ones_like(class_probs, dtype=torch.bool).to(device)
-        for i, (l, f) in enumerate(zip(lemmas, frames)):
-            candidates = self.frame_role_dict.get((l, f), [])
-            if candidates:
-                canidate_ids = [
-                    self.vocab.get_token_index(r, namespace="labels") for r in candidates
-                ]
-                canidate_ids = torch.tensor(canidate_ids).to(device)
-                canidate_ids = canidate_ids.repeat(candidate_mask.shape[1], 1)
-                candidate_mask[i].scatter_(1, canidate_ids, False)
-            else:
-                candidate_mask[i].fill_(False)
-        class_probs.masked_fill_(candidate_mask, 0)
-        return output_dict
-
-    @overrides
-    def get_metrics(self, reset: bool = False):
-        role_metric_dict = self.f1_role_metric.get_metric(reset=reset)
-        frame_metric_dict = self.f1_frame_metric.get_metric(reset=reset)
-        # This can be a lot of metrics, as there are 3 per class.
-        # we only really care about the overall metrics, so we filter for them here.
-        # metric_dict_filtered = {
-        #     x.split("-")[0] + "_role": y for x, y in metric_dict.items() if "overall" in x
-        # }
-        metric_dict = {
-            "f1_role": role_metric_dict["fscore"],
-            "f1_frame": frame_metric_dict["fscore"],
-        }
-        return metric_dict
-
-    def _get_label_tokens(self, namespace: str = "labels"):
-        return self.vocab.get_token_to_index_vocabulary(namespace).keys()
-
-    def _get_label_ids(self, namespace: str = "labels"):
-        return self.vocab.get_index_to_token_vocabulary(namespace).keys()
-
-    default_predictor = "transformer_srl"
-
+import pathlib
+import warnings
+from typing import Any, Dict, List, Union
+
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import torch.nn.functional as F
+from allennlp.common.checks import ConfigurationError
+from allennlp.data import TextFieldTensors, Vocabulary
+from allennlp.models.model import Model
+from allennlp.modules import Seq2SeqEncoder
+from allennlp.nn import InitializerApplicator, util
+from allennlp.nn.util import get_device_of, get_text_field_mask, sequence_cross_entropy_with_logits
+from allennlp.training.metrics.fbeta_measure import FBetaMeasure
+from allennlp_models.structured_prediction import SrlBert
+from allennlp_models.structured_prediction.metrics.srl_eval_scorer import (
+    DEFAULT_SRL_EVAL_PATH,
+    SrlEvalScorer,
+)
+from overrides import overrides
+from torch import nn
+from transformers import AutoModel
+from transformers.tokenization_auto import AutoConfig
+
+from transformer_srl.metrics import MicroFBetaMeasure
+from transformer_srl.utils import load_label_list, load_lemma_frame, load_role_frame
+
+LEMMA_FRAME_PATH = pathlib.Path(__file__).resolve().parent / "resources" / "lemma2frame.csv"
+FRAME_ROLE_PATH = pathlib.Path(__file__).resolve().parent / "resources" / "frame2role.csv"
+FRAME_LIST_PATH = pathlib.Path(__file__).resolve().parent / "resources" / "framelist.txt"
+
+
+class _InferenceOnlyWrapper(nn.Module):
+    """
+    Wraps a model's `forward_for_inference` as a plain `forward`, so that
+    `torch.onnx.export` traces only the tensor-in / tensor-out subgraph.
+    """
+
+    def __init__(self, model: nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, verb_indicator, frame_indicator, mask):
+        return self.model.forward_for_inference(input_ids, verb_indicator, frame_indicator, mask)
+
+
+@Model.register("transformer_srl_span")
+class TransformerSrlSpan(SrlBert):
+    """
+
+    # Parameters
+
+    vocab : `Vocabulary`, required
+        A Vocabulary, required in order to compute sizes for input/output projections.
+    model : `Union[str, AutoModel]`, required.
+        A string describing the BERT model to load or an already constructed AutoModel.
+    initializer : `InitializerApplicator`, optional (default=`InitializerApplicator()`)
+        Used to initialize the model parameters.
+    label_smoothing : `float`, optional (default = `0.0`)
+        Whether or not to use label smoothing on the labels when computing cross entropy loss.
+        The value is the nominal epsilon: it is doubled internally to undo the
+        halved-epsilon convention of `sequence_cross_entropy_with_logits`.
+    ignore_span_metric : `bool`, optional (default = `False`)
+        Whether to calculate span loss, which is irrelevant when predicting BIO for Open Information Extraction.
+    srl_eval_path : `str`, optional (default=`DEFAULT_SRL_EVAL_PATH`)
+        The path to the srl-eval.pl script. By default, will use the srl-eval.pl included with allennlp,
+        which is located at allennlp/tools/srl-eval.pl . If `None`, srl-eval.pl is not used.
+    compile_forward : `bool`, optional (default = `False`)
+        If `True` and `torch.compile` is available, the tensor-only part of the
+        forward pass (projection head and softmaxes) is compiled with
+        `mode="reduce-overhead"`. Mostly useful when serving with fixed-size
+        batches, where the static-shape cache is hit.
+    amp_dtype : `str`, optional (default = `None`)
+        If set to `"bfloat16"` or `"float16"`, the transformer and the
+        projection head run under `torch.autocast` with that dtype; the logits
+        are cast back to float32 before losses and softmaxes. Requires a torch
+        version that provides `torch.autocast`.
+    """
+
+    # maximum number of token rows per projection GEMM call
+    projection_tile_rows = 4096
+
+    def __init__(
+        self,
+        vocab: Vocabulary,
+        bert_model: Union[str, AutoModel],
+        embedding_dropout: float = 0.0,
+        initializer: InitializerApplicator = InitializerApplicator(),
+        label_smoothing: float = None,
+        ignore_span_metric: bool = False,
+        srl_eval_path: str = DEFAULT_SRL_EVAL_PATH,
+        restrict_frames: bool = False,
+        restrict_roles: bool = False,
+        inventory: str = "verbatlas",
+        compile_forward: bool = False,
+        amp_dtype: str = None,
+        **kwargs,
+    ) -> None:
+        # bypass SrlBert constructor
+        Model.__init__(self, vocab, **kwargs)
+        self.lemma_frame_dict = load_lemma_frame(LEMMA_FRAME_PATH)
+        self.frame_role_dict = load_role_frame(FRAME_ROLE_PATH)
+        self.restrict_frames = restrict_frames
+        self.restrict_roles = restrict_roles
+        self.transformer = AutoModel.from_pretrained(bert_model)
+        self.frame_criterion = nn.CrossEntropyLoss()
+        if inventory == "verbatlas":
+            # add missing labels
+            frame_list = load_label_list(FRAME_LIST_PATH)
+            self.vocab.add_tokens_to_namespace(frame_list, "frames_labels")
+        self.num_classes = self.vocab.get_vocab_size("labels")
+        self.frame_num_classes = self.vocab.get_vocab_size("frames_labels")
+        if srl_eval_path is not None:
+            # For the span based evaluation, we don't want to consider labels
+            # for verb, because the verb index is provided to the model.
+            self.span_metric = SrlEvalScorer(srl_eval_path, ignore_classes=["V"])
+        else:
+            self.span_metric = None
+        self.f1_frame_metric = MicroFBetaMeasure()
+        # a single projection over both label spaces: one GEMM instead of
+        # two, the output is split into role and frame logits afterwards.
+        self.joint_projection_layer = nn.Linear(
+            self.transformer.config.hidden_size, self.num_classes + self.frame_num_classes
+        )
+        # old checkpoints store the two heads separately
+        self._register_load_state_dict_pre_hook(self._remap_projection_layers)
+        self.embedding_dropout = nn.Dropout(p=embedding_dropout)
+        if label_smoothing:
+            # sequence_cross_entropy_with_logits spreads only half of the
+            # nominal epsilon over the non-gold labels; double it here so the
+            # config value means what it says, instead of every config
+            # compensating on its own.
+            if not 0.0 < label_smoothing < 0.5:
+                raise ConfigurationError(
+                    "label_smoothing is doubled internally, so it must be in "
+                    f"(0, 0.5): got {label_smoothing}, which would leave the "
+                    "gold label with a zero or negative weight."
+                )
+            warnings.warn(
+                "label_smoothing is doubled before being passed to the loss to "
+                "compensate for its halved-epsilon convention; configs that "
+                "already doubled the value should go back to the nominal one."
+            )
+            self._label_smoothing = 2 * label_smoothing
+        else:
+            # None and 0.0 both take the cheaper gather-based loss path
+            self._label_smoothing = None
+        self.ignore_span_metric = ignore_span_metric
+        # pre-resolve the candidate frame ids for every lemma once, so that
+        # decode_frames can restrict the predictions with a single gather
+        # instead of a vocabulary lookup per candidate per example.
+        self._lemma_frame_ids = self._build_lemma_frame_ids()
+        # per-tag pieces of the BIO -> CoNLL conversion, precomputed so the
+        # metric path does dict lookups instead of slicing strings per token
+        self._bio_conll_table = {
+            tag: (tag[0] == "B", tag[1:], "(" + tag[2:])
+            for tag in self._get_label_tokens("labels")
+            if tag != "O"
+        }
+        # BIO transition potentials for viterbi decoding, built lazily and
+        # cached since they only depend on the label vocabulary.
+        self._viterbi_transitions = None
+        self._viterbi_start_transitions = None
+        # the span metric is updated on a background thread, so the viterbi
+        # decoding of one batch overlaps with the next batch's forward pass;
+        # the executor is created lazily on the first eval batch. per-batch
+        # get_metrics reads report the last values computed at a reset, so
+        # they never wait on (or race with) the background updates.
+        self._metric_executor = None
+        self._pending_metric_futures = []
+        self._last_span_metrics = {}
+        if amp_dtype is not None:
+            if amp_dtype not in ("bfloat16", "float16"):
+                raise ConfigurationError(f"amp_dtype must be 'bfloat16' or 'float16', got {amp_dtype}")
+            if not hasattr(torch, "autocast"):
+                raise ConfigurationError("amp_dtype requires a torch version with torch.autocast")
+            self._amp_dtype = getattr(torch, amp_dtype)
+        else:
+            self._amp_dtype = None
+        if compile_forward and hasattr(torch, "compile"):
+            # only the tensor-only inner function is compiled: the python
+            # metadata handling in forward would cause graph breaks.
+            self._forward_tensors = torch.compile(
+                self._forward_tensors, dynamic=False, mode="reduce-overhead"
+            )
+        initializer(self)
+
+    def _build_lemma_frame_ids(self) -> Dict[str, torch.Tensor]:
+        label_set = set(self._get_label_tokens("frames_labels"))
+        lemma_frame_ids = {}
+        for lemma, frames in self.lemma_frame_dict.items():
+            # clear candidates from unknowns
+            ids = [
+                self.vocab.get_token_index(f, namespace="frames_labels")
+                for f in frames
+                if f in label_set
+            ]
+            if ids:
+                lemma_frame_ids[lemma] = torch.tensor(ids, dtype=torch.long)
+        return lemma_frame_ids
+
+    def _convert_bio_tags_to_conll_format(self, labels: List[str]) -> List[str]:
+        """
+        Table-driven equivalent of allennlp's `convert_bio_tags_to_conll_format`:
+        the per-tag pieces (begin flag, span suffix, opening bracket) come from
+        `self._bio_conll_table` instead of being re-sliced for every token.
+        """
+        table = self._bio_conll_table
+        outside = (False, "", None)
+        entries = []
+        for label in labels:
+            if label == "O":
+                entries.append(outside)
+            else:
+                entry = table.get(label)
+                if entry is None:
+                    # gold tags can contain labels missing from the vocabulary
+                    entry = table.setdefault(label, (label[0] == "B", label[1:], "(" + label[2:]))
+                entries.append(entry)
+        sentence_length = len(labels)
+        conll_labels = []
+        for i, (is_begin, suffix, opening) in enumerate(entries):
+            if opening is None:
+                conll_labels.append("*")
+                continue
+            new_label = "*"
+            if is_begin or i == 0 or suffix != entries[i - 1][1]:
+                new_label = opening + new_label
+            if i == sentence_length - 1 or entries[i + 1][0] or suffix != entries[i + 1][1]:
+                new_label = new_label + ")"
+            conll_labels.append(new_label)
+        return conll_labels
+
+    def _remap_projection_layers(
+        self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs
+    ):
+        """
+        Rewrite checkpoints saved with separate `tag_projection_layer` and
+        `frame_projection_layer` heads into the fused `joint_projection_layer`.
+        """
+        tag_weight = state_dict.pop(prefix + "tag_projection_layer.weight", None)
+        if tag_weight is None:
+            return
+        frame_weight = state_dict.pop(prefix + "frame_projection_layer.weight")
+        tag_bias = state_dict.pop(prefix + "tag_projection_layer.bias")
+        frame_bias = state_dict.pop(prefix + "frame_projection_layer.bias")
+        state_dict[prefix + "joint_projection_layer.weight"] = torch.cat(
+            [tag_weight, frame_weight], dim=0
+        )
+        state_dict[prefix + "joint_projection_layer.bias"] = torch.cat([tag_bias, frame_bias])
+
+    def _forward_tensors(
+        self, bert_embeddings: torch.Tensor, frame_mask: torch.Tensor, mask: torch.Tensor
+    ):
+        """
+        The tensor-only part of the forward pass, kept free of python-level
+        metadata handling so it can be wrapped with `torch.compile`.
+
+        The projection head runs padding-free: the valid tokens are packed
+        into a `(num_valid, hidden)` tensor, projected, and scattered back
+        into the padded layout, so the GEMM does no work on padding. Logits
+        at padded positions are zero; every consumer (masked loss, viterbi
+        decoding, the metrics) already ignores them.
+        """
+        embedded_text_input = self.embedding_dropout(bert_embeddings)
+        batch_size, sequence_length, hidden_size = embedded_text_input.size()
+        valid_indices = mask.view(-1).nonzero(as_tuple=False).squeeze(1)
+        flat_embeddings = embedded_text_input.view(-1, hidden_size).index_select(0, valid_indices)
+        # outputs: one projection over both label spaces, split afterwards.
+        # very large batches are projected in row tiles: the label dimension
+        # is narrow, so cache-sized tiles utilize the hardware better than one
+        # huge skinny GEMM.
+        num_valid = flat_embeddings.size(0)
+        tile_rows = self.projection_tile_rows
+        if num_valid > tile_rows:
+            flat_joint_logits = flat_embeddings.new_empty(
+                (num_valid, self.num_classes + self.frame_num_classes)
+            )
+            for start in range(0, num_valid, tile_rows):
+                flat_joint_logits[start : start + tile_rows] = self.joint_projection_layer(
+                    flat_embeddings[start : start + tile_rows]
+                )
+        else:
+            flat_joint_logits = self.joint_projection_layer(flat_embeddings)
+        joint_logits = flat_joint_logits.new_zeros(
+            (batch_size * sequence_length, self.num_classes + self.frame_num_classes)
+        )
+        joint_logits.index_copy_(0, valid_indices, flat_joint_logits)
+        joint_logits = joint_logits.view(batch_size, sequence_length, -1)
+        logits = joint_logits[:, :, : self.num_classes].contiguous()
+        frame_logits = joint_logits[frame_mask][:, self.num_classes :]
+
+        # the probabilities are only needed for decoding: skip the softmax
+        # kernels and their (batch, tokens, classes) allocation at train time.
+        # make_output_human_readable recomputes them on demand if missing.
+        if self.training:
+            class_probabilities = None
+            frame_probabilities = None
+        else:
+            class_probabilities = F.softmax(logits, dim=-1)
+            frame_probabilities = F.softmax(frame_logits, dim=-1)
+        return logits, frame_logits, class_probabilities, frame_probabilities
+
+    def forward(  # type: ignore
+        self,
+        tokens: TextFieldTensors,
+        verb_indicator: torch.Tensor,
+        frame_indicator: torch.Tensor,
+        metadata: List[Any],
+        tags: torch.LongTensor = None,
+        frame_tags: torch.LongTensor = None,
+    ):
+
+        """
+        # Parameters
+
+        tokens : `TextFieldTensors`, required
+            The output of `TextField.as_array()`, which should typically be passed directly to a
+            `TextFieldEmbedder`. For this model, this must be a `SingleIdTokenIndexer` which
+            indexes wordpieces from the BERT vocabulary.
+        verb_indicator: `torch.LongTensor`, required.
+            An integer `SequenceFeatureField` representation of the position of the verb
+            in the sentence. This should have shape (batch_size, num_tokens) and importantly, can be
+            all zeros, in the case that the sentence has no verbal predicate.
+        frame_indicator: torch.LongTensor, required.
+            An integer ``SequenceFeatureField`` representation of the position of the frame
+            in the sentence. This should have shape (batch_size, num_tokens). Similar to verb_indicator,
+            but handles bert wordpiece tokenizer by cosnidering a frame only the first subtoken.
+        tags : `torch.LongTensor`, optional (default = `None`)
+            A torch tensor representing the sequence of integer gold class labels
+            of shape `(batch_size, num_tokens)`
+        frame_tags : torch.LongTensor, optional (default = None)
+            A torch tensor representing the gold frames
+            of shape ``(batch_size, num_tokens)``
+        metadata : `List[Dict[str, Any]]`, optional, (default = `None`)
+            metadata containg the original words in the sentence, the verb to compute the
+            frame for, and start offsets for converting wordpieces back to a sequence of words,
+            under 'words', 'verb' and 'offsets' keys, respectively.
+
+        # Returns
+
+        An output dictionary consisting of:
+        logits : `torch.FloatTensor`
+            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
+            unnormalised log probabilities of the tag classes.
+        class_probabilities : `torch.FloatTensor`
+            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
+            a distribution of the tag classes per word.
+        loss : `torch.FloatTensor`, optional
+            A scalar loss to be optimised.
+        """
+        mask = get_text_field_mask(tokens)
+        input_ids = util.get_token_ids_from_text_field_tensors(tokens)
+        # computed once: reused for the frame gather and the frame tags below
+        frame_mask = frame_indicator.bool()
+        if self._amp_dtype is not None:
+            autocast = torch.autocast(
+                device_type="cuda" if input_ids.is_cuda else "cpu", dtype=self._amp_dtype
+            )
+        else:
+            autocast = contextlib.suppress()
+        with autocast:
+            bert_embeddings, _ = self.transformer(
+                input_ids=input_ids, token_type_ids=verb_indicator, attention_mask=mask,
+            )
+            logits, frame_logits, class_probabilities, frame_probabilities = self._forward_tensors(
+                bert_embeddings, frame_mask, mask
+            )
+        if self._amp_dtype is not None:
+            # losses and softmaxes are numerically sensitive: back to float32
+            logits = logits.float()
+            frame_logits = frame_logits.float()
+            if class_probabilities is not None:
+                class_probabilities = class_probabilities.float()
+                frame_probabilities = frame_probabilities.float()
+        # We need to retain the mask in the output dictionary
+        # so that we can crop the sequences to remove padding
+        # when we do viterbi inference in self.make_output_human_readable.
+        output_dict = {
+            "logits": logits,
+            "frame_logits": frame_logits,
+            "class_probabilities": class_probabilities,
+            "frame_probabilities": frame_probabilities,
+            "mask": mask,
+        }
+        # We add in the offsets here so we can compute the un-wordpieced tags.
+        # A single pass over the metadata collects everything forward needs.
+        words = []
+        verbs = []
+        offsets = []
+        lemmas = []
+        verb_indices = []
+        gold_tags = []
+        for example_metadata in metadata:
+            words.append(example_metadata["words"])
+            verbs.append(example_metadata["verb"])
+            offsets.append(example_metadata["offsets"])
+            lemmas.extend(example_metadata["lemmas"])
+            verb_indices.append(example_metadata.get("verb_index"))
+            gold_tags.append(example_metadata.get("gold_tags"))
+        output_dict["words"] = words
+        output_dict["lemma"] = lemmas
+        output_dict["verb"] = verbs
+        output_dict["wordpiece_offsets"] = offsets
+
+        if tags is not None:
+            # compute role loss
+            role_loss = sequence_cross_entropy_with_logits(
+                logits, tags, mask, label_smoothing=self._label_smoothing
+            )
+            # compute frame loss, skipping the kernels (and the NaN that the
+            # mean reduction produces) when the batch has no frame positions
+            if frame_logits.size(0) > 0:
+                frame_tags_filtered = frame_tags[frame_mask]
+                frame_loss = self.frame_criterion(frame_logits, frame_tags_filtered)
+                self.f1_frame_metric(frame_logits, frame_tags_filtered)
+            else:
+                frame_loss = logits.new_zeros(())
+            if not self.ignore_span_metric and self.span_metric is not None and not self.training:
+                # decode and accumulate on a background thread, so the next
+                # batch's forward pass starts while this one is scored
+                if self._metric_executor is None:
+                    self._metric_executor = ThreadPoolExecutor(max_workers=1)
+                decode_inputs = {
+                    "logits": logits.detach(),
+                    "class_probabilities": class_probabilities.detach(),
+                    "mask": mask,
+                    "wordpiece_offsets": offsets,
+                }
+                if self.restrict_roles:
+                    # the metric must score the restricted predictions, which
+                    # needs the frame outputs; _mask_args also edits the
+                    # probabilities in place, so hand the worker its own copy
+                    decode_inputs["class_probabilities"] = class_probabilities.detach().clone()
+                    decode_inputs["frame_logits"] = frame_logits.detach()
+                    decode_inputs["frame_probabilities"] = frame_probabilities.detach()
+                    decode_inputs["lemma"] = lemmas
+                self._pending_metric_futures.append(
+                    self._metric_executor.submit(
+                        self._update_span_metric, decode_inputs, verb_indices, words, gold_tags,
+                    )
+                )
+            output_dict["frame_loss"] = frame_loss
+            output_dict["role_loss"] = role_loss
+            # one add and an in-place halve: no extra temporary for the division
+            output_dict["loss"] = torch.add(role_loss, frame_loss).mul_(0.5)
+        return output_dict
+
+    def decode_frames(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        # frame prediction
+        frame_probabilities = output_dict.get("frame_probabilities")
+        if frame_probabilities is None:
+            frame_probabilities = F.softmax(output_dict["frame_logits"], dim=-1)
+            output_dict["frame_probabilities"] = frame_probabilities
+        if self.restrict_frames:
+            # restrict candidates from verbatlas inventory, batched as a
+            # single gather + argmax on the same device as the probabilities
+            lemmas = output_dict["lemma"]
+            candidate_ids = [self._lemma_frame_ids.get(l) for l in lemmas]
+            max_candidates = max((c.numel() for c in candidate_ids if c is not None), default=0)
+            if max_candidates > 0:
+                device = frame_probabilities.device
+                # pad the per-lemma candidate ids with -1
+                indices = torch.full(
+                    (len(candidate_ids), max_candidates), -1, dtype=torch.long, device=device
+                )
+                for i, c in enumerate(candidate_ids):
+                    if c is not None:
+                        indices[i, : c.numel()] = c.to(device)
+                padding = indices < 0
+                candidate_probs = frame_probabilities.gather(1, indices.clamp(min=0))
+                candidate_probs = candidate_probs.masked_fill(padding, float("-inf"))
+                restricted = indices.gather(
+                    1, candidate_probs.argmax(dim=-1, keepdim=True)
+                ).squeeze(-1)
+                # fall back to the full argmax for lemmas without candidates
+                unrestricted = frame_probabilities.argmax(dim=-1)
+                frame_predictions = torch.where(padding.all(dim=-1), unrestricted, restricted)
+            else:
+                frame_predictions = frame_probabilities.argmax(dim=-1)
+            frame_predictions = frame_predictions.tolist()
+        else:
+            frame_predictions = frame_probabilities.argmax(dim=-1).tolist()
+
+        output_dict["frame_tags"] = [
+            self.vocab.get_token_from_index(f, namespace="frames_labels") for f in frame_predictions
+        ]
+        output_dict["frame_scores"] = [
+            fp[f] for f, fp in zip(frame_predictions, frame_probabilities)
+        ]
+        return output_dict
+
+    def _batched_viterbi_decode(
+        self, class_probabilities: torch.Tensor, mask: torch.Tensor
+    ) -> List[List[int]]:
+        """
+        Viterbi-decode a whole batch at once. The forward recurrence runs as
+        `sequence_length` max-reductions over `(batch_size, num_classes)`
+        state tensors on the device holding the probabilities, instead of one
+        python-level `viterbi_decode` call per example; the chosen paths are
+        moved to CPU in a single copy at the end.
+        """
+        if self._viterbi_transitions is None:
+            self._viterbi_transitions = self.get_viterbi_pairwise_potentials()
+            self._viterbi_start_transitions = self.get_start_transitions()
+        device = class_probabilities.device
+        transitions = self._viterbi_transitions.to(device)
+        start_transitions = self._viterbi_start_transitions.to(device)
+
+        batch_size, sequence_length, num_classes = class_probabilities.size()
+        delta = class_probabilities[:, 0] + start_transitions
+        identity = torch.arange(num_classes, device=device).expand(batch_size, -1)
+        backpointers = []
+        for t in range(1, sequence_length):
+            best, backpointer = (delta.unsqueeze(-1) + transitions).max(dim=1)
+            # carry the state of padded steps through unchanged, so that the
+            # final `delta` is the one each example had at its last real token
+            step_mask = mask[:, t].unsqueeze(-1)
+            delta = torch.where(step_mask, best + class_probabilities[:, t], delta)
+            backpointers.append(torch.where(step_mask, backpointer, identity))
+
+        best_last = delta.argmax(dim=-1)
+        path = [best_last]
+        for backpointer in reversed(backpointers):
+            best_last = backpointer.gather(1, best_last.unsqueeze(1)).squeeze(1)
+            path.append(best_last)
+        path.reverse()
+        paths = torch.stack(path, dim=1).cpu().tolist()
+        lengths = mask.sum(-1).cpu().tolist()
+        return [p[:length] for p, length in zip(paths, lengths)]
+
+    def _viterbi_tags(self, output_dict: Dict[str, torch.Tensor]):
+        """
+        Decode the BIO tags for a batch, as `(wordpiece_tags, word_tags)`
+        lists of label strings. This is the role half of
+        `make_output_human_readable`, split out so the span metric can decode
+        the roles without also paying for frame decoding.
+        """
+        class_probabilities = output_dict.get("class_probabilities")
+        if class_probabilities is None:
+            class_probabilities = F.softmax(output_dict["logits"], dim=-1)
+            output_dict["class_probabilities"] = class_probabilities
+        # batched viterbi instead of the parent's per-example python loop
+        batch_tag_ids = self._batched_viterbi_decode(class_probabilities, output_dict["mask"])
+        wordpiece_tags = []
+        word_tags = []
+        for tag_ids, offsets in zip(batch_tag_ids, output_dict["wordpiece_offsets"]):
+            tags = [self.vocab.get_token_from_index(t, namespace="labels") for t in tag_ids]
+            wordpiece_tags.append(tags)
+            word_tags.append([tags[i] for i in offsets])
+        return wordpiece_tags, word_tags
+
+    @overrides
+    def make_output_human_readable(
+        self, output_dict: Dict[str, torch.Tensor]
+    ) -> Dict[str, torch.Tensor]:
+        # train-mode output dicts carry the probabilities as None: compute
+        # them here before _mask_args or the viterbi decoding touches them
+        if output_dict.get("class_probabilities") is None:
+            output_dict["class_probabilities"] = F.softmax(output_dict["logits"], dim=-1)
+        output_dict = self.decode_frames(output_dict)
+        if self.restrict_roles:
+            output_dict = self._mask_args(output_dict)
+        wordpiece_tags, word_tags = self._viterbi_tags(output_dict)
+        output_dict["wordpiece_tags"] = wordpiece_tags
+        output_dict["tags"] = word_tags
+        return output_dict
+
+    def _update_span_metric(
+        self,
+        decode_inputs: Dict[str, torch.Tensor],
+        batch_verb_indices: List[int],
+        batch_sentences: List[List[str]],
+        batch_bio_gold_tags: List[List[str]],
+    ) -> None:
+        """
+        Decode the BIO tags for one batch and feed the span metric. Runs on the
+        metric executor thread. With `restrict_roles` enabled the role
+        probabilities depend on the predicted frames, so the frame decoding
+        and `_mask_args` run first, exactly as in `make_output_human_readable`;
+        otherwise the frame predictions are not needed by the span metric and
+        only the role half is decoded.
+        """
+        if self.restrict_roles:
+            decode_inputs = self.decode_frames(decode_inputs)
+            decode_inputs = self._mask_args(decode_inputs)
+        _, batch_bio_predicted_tags = self._viterbi_tags(decode_inputs)
+        batch_conll_predicted_tags = [
+            self._convert_bio_tags_to_conll_format(tags) for tags in batch_bio_predicted_tags
+        ]
+        batch_conll_gold_tags = [
+            self._convert_bio_tags_to_conll_format(tags) for tags in batch_bio_gold_tags
+        ]
+        self.span_metric(
+            batch_verb_indices,
+            batch_sentences,
+            batch_conll_predicted_tags,
+            batch_conll_gold_tags,
+        )
+
+    def _drain_metric_futures(self) -> None:
+        # wait for the background decodes before the metric is read (or reset)
+        for future in self._pending_metric_futures:
+            future.result()
+        self._pending_metric_futures = []
+
+    def __getstate__(self):
+        # thread pools and futures cannot be pickled or deep-copied (and
+        # quantize_for_inference deep-copies the model): finish any pending
+        # metric updates and drop the executor, it is re-created lazily on
+        # the next eval batch.
+        self._drain_metric_futures()
+        state = self.__dict__.copy()
+        state["_metric_executor"] = None
+        state["_pending_metric_futures"] = []
+        return state
+
+    def forward_for_inference(
+        self,
+        input_ids: torch.Tensor,
+        verb_indicator: torch.Tensor,
+        frame_indicator: torch.Tensor,
+        mask: torch.Tensor,
+    ):
+        """
+        Tensor-in / tensor-out inference entry point: runs the transformer and
+        the projection head and returns `(logits, frame_logits)`, with no
+        metadata handling, metrics or decoding. This is the subgraph traced by
+        `export_onnx`.
+        """
+        bert_embeddings, _ = self.transformer(
+            input_ids=input_ids, token_type_ids=verb_indicator, attention_mask=mask,
+        )
+        logits, frame_logits, _, _ = self._forward_tensors(
+            bert_embeddings, frame_indicator.bool(), mask
+        )
+        return logits, frame_logits
+
+    @staticmethod
+    def _max_onnx_opset():
+        # where torch keeps its highest supported opset moved across
+        # versions; return None when neither location exists
+        try:
+            from torch.onnx._constants import ONNX_MAX_OPSET
+
+            return ONNX_MAX_OPSET
+        except ImportError:
+            try:
+                from torch.onnx.symbolic_helper import _onnx_main_opset
+
+                return _onnx_main_opset
+            except ImportError:
+                return None
+
+    def export_onnx(self, path: str, opset_version: int = 12) -> None:
+        """
+        Export the inference-only subgraph (`forward_for_inference`) to an
+        ONNX file, with dynamic batch and sequence axes, for serving with
+        ONNX Runtime. Viterbi decoding and `decode_frames` stay on the python
+        side and should be run on the returned logits. The default opset is
+        the highest the pinned torch supports; on newer torch versions a
+        higher `opset_version` (e.g. 17) gives ONNX Runtime more fusions.
+        """
+        max_opset = self._max_onnx_opset()
+        if max_opset is not None and opset_version > max_opset:
+            raise ConfigurationError(
+                f"opset_version {opset_version} is not supported by this torch "
+                f"version (maximum {max_opset}); pass opset_version<={max_opset}."
+            )
+        was_training = self.training
+        self.eval()
+        input_ids = torch.ones((1, 8), dtype=torch.long)
+        verb_indicator = torch.zeros((1, 8), dtype=torch.long)
+        frame_indicator = torch.zeros((1, 8), dtype=torch.long)
+        frame_indicator[0, 1] = 1
+        mask = torch.ones((1, 8), dtype=torch.bool)
+        sequence_axes = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                _InferenceOnlyWrapper(self),
+                (input_ids, verb_indicator, frame_indicator, mask),
+                str(path),
+                input_names=["input_ids", "verb_indicator", "frame_indicator", "mask"],
+                output_names=["logits", "frame_logits"],
+                dynamic_axes={
+                    "input_ids": sequence_axes,
+                    "verb_indicator": sequence_axes,
+                    "frame_indicator": sequence_axes,
+                    "mask": sequence_axes,
+                    "logits": sequence_axes,
+                    "frame_logits": {0: "frames"},
+                },
+                opset_version=opset_version,
+                do_constant_folding=True,
+            )
+        self.train(was_training)
+
+    def quantize_for_inference(self) -> "TransformerSrlSpan":
+        """
+        Return a copy of the model with every `Linear` layer (the transformer's
+        and the projection head's) dynamically quantized to int8. This is
+        CPU-inference only: the quantized linears have no float parameters, so
+        the copy cannot be trained or moved to GPU. The returned model is put
+        in eval mode.
+        """
+        quantized = torch.quantization.quantize_dynamic(self, {nn.Linear}, dtype=torch.qint8)
+        quantized.eval()
+        return quantized
+
+    def _mask_args(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        class_probs = output_dict["class_probabilities"]
+        device = get_device_of(class_probs)
+        lemmas = output_dict["lemma"]
+        frames = output_dict["frame_tags"]
+        candidate_mask = torch.ones_like(class_probs, dtype=torch.bool).to(device)
+        for i, (l, f) in enumerate(zip(lemmas, frames)):
+            candidates = self.frame_role_dict.get((l, f), [])
+            if candidates:
+                canidate_ids = [
+                    self.vocab.get_token_index(r, namespace="labels") for r in candidates
+                ]
+                canidate_ids = torch.tensor(canidate_ids).to(device)
+                canidate_ids = canidate_ids.repeat(candidate_mask.shape[1], 1)
+                candidate_mask[i].scatter_(1, canidate_ids, False)
+            else:
+                candidate_mask[i].fill_(False)
+        class_probs.masked_fill_(candidate_mask, 0)
+        return output_dict
+
+    @overrides
+    def get_metrics(self, reset: bool = False):
+        if self.ignore_span_metric:
+            # Return an empty dictionary if ignoring the
+            # span metric
+            return {}
+
+        if reset:
+            # only wait for the background decodes when the metric is
+            # actually consumed; the per-batch (non-reset) reads report the
+            # values from the last reset instead, so they neither serialize
+            # the next forward pass nor race with the background updates.
+            self._drain_metric_futures()
+            metric_dict = self.span_metric.get_metric(reset=True)
+            # This can be a lot of metrics, as there are 3 per class.
+            # we only really care about the overall metrics, so we filter for them here.
+            self._last_span_metrics = {
+                x.split("-")[0] + "_role": y
+                for x, y in metric_dict.items()
+                if "overall" in x and "f1" in x
+            }
+        frame_metric_dict = self.f1_frame_metric.get_metric(reset=reset)
+        frame_metric_dict = {
+            x + "_frame": y for x, y in frame_metric_dict.items() if "fscore" in x
+        }
+        return {**self._last_span_metrics, **frame_metric_dict}
+
+    def _get_label_tokens(self, namespace: str = "labels"):
+        return self.vocab.get_token_to_index_vocabulary(namespace).keys()
+
+    def _get_label_ids(self, namespace: str = "labels"):
+        return self.vocab.get_index_to_token_vocabulary(namespace).keys()
+
+    default_predictor = "transformer_srl"
+
+
+@Model.register("transformer_srl_dependency")
+class TransformerSrlDependency(Model):
+    """
+
+    # Parameters
+
+    vocab : `Vocabulary`, required
+        A Vocabulary, required in order to compute sizes for input/output projections.
+    model : `Union[str, AutoModel]`, required.
+        A string describing the BERT model to load or an already constructed AutoModel.
+    initializer : `InitializerApplicator`, optional (default=`InitializerApplicator()`)
+        Used to initialize the model parameters.
+    label_smoothing : `float`, optional (default = `0.0`)
+        Whether or not to use label smoothing on the labels when computing cross entropy loss.
+    ignore_span_metric : `bool`, optional (default = `False`)
+        Whether to calculate span loss, which is irrelevant when predicting BIO for Open Information Extraction.
+    srl_eval_path : `str`, optional (default=`DEFAULT_SRL_EVAL_PATH`)
+        The path to the srl-eval.pl script. By default, will use the srl-eval.pl included with allennlp,
+        which is located at allennlp/tools/srl-eval.pl . If `None`, srl-eval.pl is not used.
+    """
+
+    def __init__(
+        self,
+        vocab: Vocabulary,
+        model_name: Union[str, AutoModel],
+        embedding_dropout: float = 0.0,
+        initializer: InitializerApplicator = InitializerApplicator(),
+        label_smoothing: float = None,
+        ignore_span_metric: bool = False,
+        srl_eval_path: str = DEFAULT_SRL_EVAL_PATH,
+        restrict_frames: bool = False,
+        restrict_roles: bool = False,
+        **kwargs,
+    ) -> None:
+        # bypass SrlBert constructor
+        Model.__init__(self, vocab, **kwargs)
+        self.lemma_frame_dict = load_lemma_frame(LEMMA_FRAME_PATH)
+        self.frame_role_dict = load_role_frame(FRAME_ROLE_PATH)
+        self.restrict_frames = restrict_frames
+        self.restrict_roles = restrict_roles
+
+        if isinstance(model_name, str):
+            self.transformer = AutoModel.from_pretrained(model_name)
+        else:
+            self.transformer = model_name
+        # loss
+        self.role_criterion = nn.CrossEntropyLoss(ignore_index=0)
+        self.frame_criterion = nn.CrossEntropyLoss()
+        # number of classes
+        self.num_classes = self.vocab.get_vocab_size("labels")
+        self.frame_num_classes = self.vocab.get_vocab_size("frames_labels")
+        # metrics
+        role_set = self.vocab.get_token_to_index_vocabulary("labels")
+        role_set_filter = [v for k, v in role_set.items() if k != "O"]
+        self.f1_role_metric = FBetaMeasure(average="micro", labels=role_set_filter)
+        self.f1_frame_metric = MicroFBetaMeasure()
+        # output layer
+        self.tag_projection_layer = nn.Linear(self.transformer.config.hidden_size, self.num_classes)
+        self.frame_projection_layer = nn.Linear(
+            self.transformer.config.hidden_size, self.frame_num_classes
+        )
+        self.embedding_dropout = nn.Dropout(p=embedding_dropout)
+        self._label_smoothing = label_smoothing
+        self._lemma_frame_ids = self._build_lemma_frame_ids()
+        initializer(self)
+
+    def _build_lemma_frame_ids(self) -> Dict[str, torch.Tensor]:
+        label_set = set(self._get_label_tokens("frames_labels"))
+        lemma_frame_ids = {}
+        for lemma, frames in self.lemma_frame_dict.items():
+            # clear candidates from unknowns
+            ids = [
+                self.vocab.get_token_index(f, namespace="frames_labels")
+                for f in frames
+                if f in label_set
+            ]
+            if ids:
+                lemma_frame_ids[lemma] = torch.tensor(ids, dtype=torch.long)
+        return lemma_frame_ids
+
+    def forward(  # type: ignore
+        self,
+        tokens: TextFieldTensors,
+        verb_indicator: torch.Tensor,
+        frame_indicator: torch.Tensor,
+        metadata: List[Any],
+        tags: torch.LongTensor = None,
+        frame_tags: torch.LongTensor = None,
+    ):
+
+        """
+        # Parameters
+
+        tokens : `TextFieldTensors`, required
+            The output of `TextField.as_array()`, which should typically be passed directly to a
+            `TextFieldEmbedder`. For this model, this must be a `SingleIdTokenIndexer` which
+            indexes wordpieces from the BERT vocabulary.
+        verb_indicator: `torch.LongTensor`, required.
+            An integer `SequenceFeatureField` representation of the position of the verb
+            in the sentence. This should have shape (batch_size, num_tokens) and importantly, can be
+            all zeros, in the case that the sentence has no verbal predicate.
+        tags : `torch.LongTensor`, optional (default = `None`)
+            A torch tensor representing the sequence of integer gold class labels
+            of shape `(batch_size, num_tokens)`
+        frame_tags : torch.LongTensor, optional (default = None)
+            A torch tensor representing the gold frames
+            of shape ``(batch_size, num_tokens)``
+        metadata : `List[Dict[str, Any]]`, optional, (default = `None`)
+            metadata containg the original words in the sentence, the verb to compute the
+            frame for, and start offsets for converting wordpieces back to a sequence of words,
+            under 'words', 'verb' and 'offsets' keys, respectively.
+
+        # Returns
+
+        An output dictionary consisting of:
+        logits : `torch.FloatTensor`
+            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
+            unnormalised log probabilities of the tag classes.
+        class_probabilities : `torch.FloatTensor`
+            A tensor of shape `(batch_size, num_tokens, tag_vocab_size)` representing
+            a distribution of the tag classes per word.
+        loss : `torch.FloatTensor`, optional
+            A scalar loss to be optimised.
+        """
+        mask = get_text_field_mask(tokens)
+        bert_embeddings, _ = self.transformer(
+            input_ids=util.get_token_ids_from_text_field_tensors(tokens),
+            token_type_ids=verb_indicator,
+            attention_mask=mask,
+        )
+
+        # extract embeddings
+        embedded_text_input = self.embedding_dropout(bert_embeddings)
+        # computed once: reused for the frame gather and the frame tags below
+        frame_mask = frame_indicator.bool()
+        frame_embeddings = embedded_text_input[frame_mask]
+        # get sizes
+        batch_size, sequence_length, _ = embedded_text_input.size()
+        # outputs
+        logits = self.tag_projection_layer(embedded_text_input)
+        if frame_embeddings.size(0) > 0:
+            frame_logits = self.frame_projection_layer(frame_embeddings)
+        else:
+            # no frame positions in this batch: skip the projection entirely
+            frame_logits = embedded_text_input.new_zeros((0, self.frame_num_classes))
+
+        reshaped_log_probs = logits.view(-1, self.num_classes)
+        role_probabilities = F.softmax(reshaped_log_probs, dim=-1).view(
+            [batch_size, sequence_length, self.num_classes]
+        )
+        frame_probabilities = F.softmax(frame_logits, dim=-1)
+        # We need to retain the mask in the output dictionary
+        # so that we can crop the sequences to remove padding
+        # when we do viterbi inference in self.make_output_human_readable.
+        output_dict = {
+            "logits": logits,
+            "frame_logits": frame_logits,
+            "role_probabilities": role_probabilities,
+            "frame_probabilities": frame_probabilities,
+            "mask": mask,
+        }
+        # We add in the offsets here so we can compute the un-wordpieced tags.
+        # A single pass over the metadata collects everything forward needs.
+        words = []
+        verbs = []
+        lemmas = []
+        for example_metadata in metadata:
+            words.append(example_metadata["words"])
+            verbs.append(example_metadata["verb"])
+            lemmas.extend(example_metadata["lemmas"])
+        output_dict["words"] = words
+        output_dict["verb"] = verbs
+        output_dict["lemma"] = lemmas
+
+        if tags is not None:
+            # compute role loss
+            # role_loss = sequence_cross_entropy_with_logits(
+            #     logits, tags, mask, label_smoothing=self._label_smoothing
+            # )
+            role_loss = self.role_criterion(logits.view(-1, self.num_classes), tags.view(-1))
+            # compute frame loss, skipping the kernels (and the NaN that the
+            # mean reduction produces) when the batch has no frame positions
+            if frame_logits.size(0) > 0:
+                frame_tags_filtered = frame_tags[frame_mask]
+                frame_loss = self.frame_criterion(frame_logits, frame_tags_filtered)
+                self.f1_frame_metric(frame_logits, frame_tags_filtered)
+            else:
+                frame_loss = logits.new_zeros(())
+
+            self.f1_role_metric(role_probabilities, tags)
+
+            output_dict["frame_loss"] = frame_loss
+            output_dict["role_loss"] = role_loss
+            # one add and an in-place halve: no extra temporary for the division
+            output_dict["loss"] = torch.add(role_loss, frame_loss).mul_(0.5)
+        return output_dict
+
+    def decode_frames(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        # frame prediction
+        frame_probabilities = output_dict["frame_probabilities"]
+        if self.restrict_frames:
+            # restrict candidates from verbatlas inventory, batched as a
+            # single gather + argmax on the same device as the probabilities
+            lemmas = output_dict["lemma"]
+            candidate_ids = [self._lemma_frame_ids.get(l) for l in lemmas]
+            max_candidates = max((c.numel() for c in candidate_ids if c is not None), default=0)
+            if max_candidates > 0:
+                device = frame_probabilities.device
+                # pad the per-lemma candidate ids with -1
+                indices = torch.full(
+                    (len(candidate_ids), max_candidates), -1, dtype=torch.long, device=device
+                )
+                for i, c in enumerate(candidate_ids):
+                    if c is not None:
+                        indices[i, : c.numel()] = c.to(device)
+                padding = indices < 0
+                candidate_probs = frame_probabilities.gather(1, indices.clamp(min=0))
+                candidate_probs = candidate_probs.masked_fill(padding, float("-inf"))
+                restricted = indices.gather(
+                    1, candidate_probs.argmax(dim=-1, keepdim=True)
+                ).squeeze(-1)
+                # fall back to the full argmax for lemmas without candidates
+                unrestricted = frame_probabilities.argmax(dim=-1)
+                frame_predictions = torch.where(padding.all(dim=-1), unrestricted, restricted)
+            else:
+                frame_predictions = frame_probabilities.argmax(dim=-1)
+            frame_predictions = frame_predictions.tolist()
+        else:
+            frame_predictions = frame_probabilities.argmax(dim=-1).tolist()
+
+        output_dict["frame_tags"] = [
+            self.vocab.get_token_from_index(f, namespace="frames_labels") for f in frame_predictions
+        ]
+        output_dict["frame_scores"] = [
+            fp[f] for f, fp in zip(frame_predictions, frame_probabilities)
+        ]
+        return output_dict
+
+    @overrides
+    def make_output_human_readable(
+        self, output_dict: Dict[str, torch.Tensor], restrict: bool = True
+    ) -> Dict[str, torch.Tensor]:
+        output_dict = self.decode_frames(output_dict)
+        # if self.restrict:
+        #     output_dict = self._mask_args(output_dict)
+        # output_dict = super().make_output_human_readable(output_dict)
+        roles_probabilities = output_dict["role_probabilities"]
+        roles_predictions = roles_probabilities.argmax(dim=-1).cpu().data.numpy()
+
+        output_dict["tags"] = [
+            [self.vocab.get_token_from_index(r, namespace="labels") for r in roles]
+            for roles in roles_predictions
+        ]
+        return output_dict
+
+    def _mask_args(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        class_probs = output_dict["class_probabilities"]
+        device = get_device_of(class_probs)
+        lemmas = output_dict["lemma"]
+        frames = output_dict["frame_tags"]
+        candidate_mask = torch.ones_like(class_probs, dtype=torch.bool).to(device)
+        for i, (l, f) in enumerate(zip(lemmas, frames)):
+            candidates = self.frame_role_dict.get((l, f), [])
+            if candidates:
+                canidate_ids = [
+                    self.vocab.get_token_index(r, namespace="labels") for r in candidates
+                ]
+                canidate_ids = torch.tensor(canidate_ids).to(device)
+                canidate_ids = canidate_ids.repeat(candidate_mask.shape[1], 1)
+                candidate_mask[i].scatter_(1, canidate_ids, False)
+            else:
+                candidate_mask[i].fill_(False)
+        class_probs.masked_fill_(candidate_mask, 0)
+        return output_dict
+
+    @overrides
+    def get_metrics(self, reset: bool = False):
+        role_metric_dict = self.f1_role_metric.get_metric(reset=reset)
+        frame_metric_dict = self.f1_frame_metric.get_metric(reset=reset)
+        # This can be a lot of metrics, as there are 3 per class.
+        # we only really care about the overall metrics, so we filter for them here.
+        # metric_dict_filtered = {
+        #     x.split("-")[0] + "_role": y for x, y in metric_dict.items() if "overall" in x
+        # }
+        metric_dict = {
+            "f1_role": role_metric_dict["fscore"],
+            "f1_frame": frame_metric_dict["fscore"],
+        }
+        return metric_dict
+
+    def _get_label_tokens(self, namespace: str = "labels"):
+        return self.vocab.get_token_to_index_vocabulary(namespace).keys()
+
+    def _get_label_ids(self, namespace: str = "labels"):
+        return self.vocab.get_index_to_token_vocabulary(namespace).keys()
+
+    default_predictor = "transformer_srl"
+
@@ -4,7 +4,7 @@ from allennlp.data.tokenizers.token import Token
 
 import numpy
 from allennlp.common import plugins
-from allennlp.common.util import JsonDict, sanitize, group_by_count
+from allennlp.common.util import JsonDict, sanitize
 from allennlp.data import DatasetReader, Instance
 from allennlp.models import Model
 from allennlp.models.archival import Archive, load_archive
@@ -13,6 +13,8 @@ from allennlp_models.structured_prediction import SemanticRoleLabelerPredictor
 from overrides import overrides
 from spacy.tokens import Doc
 
+from transformer_srl.utils import length_sorted_batches
+
 
 @Predictor.register("transformer_srl")
 class SrlTransformersPredictor(SemanticRoleLabelerPredictor):
@@ -72,17 +74,15 @@ class SrlTransformersPredictor(SemanticRoleLabelerPredictor):
                 [{"verbs": [], "words": self._tokenizer.tokenize(x["sentence"])} for x in inputs]
             )
 
-        # Make the instances into batches and check the last batch for
-        # padded elements as the number of instances might not be perfectly
-        # divisible by the batch size.
-        batched_instances = group_by_count(flattened_instances, batch_size, None)
-        batched_instances[-1] = [
-            instance for instance in batched_instances[-1] if instance is not None
-        ]
-        # Run the model on the batches.
-        outputs: List[Dict[str, numpy.ndarray]] = []
-        for batch in batched_instances:
-            outputs.extend(self._model.forward_on_instances(batch))
+        # Make the instances into batches of similar length, so that each
+        # batch reaches the model with as little padding as possible, and
+        # restore the original order of the outputs afterwards.
+        outputs: List[Dict[str, numpy.ndarray]] = [None] * len(flattened_instances)
+        for batch in length_sorted_batches(flattened_instances, batch_size):
+            indices, batch_instances = zip(*batch)
+            batch_outputs = self._model.forward_on_instances(list(batch_instances))
+            for index, output in zip(indices, batch_outputs):
+                outputs[index] = output
 
         verbs_per_sentence = [len(sent) for sent in instances_per_sentence]
         return_dicts: List[JsonDict] = [{"verbs": []} for x in inputs]
@@ -1,44 +1,67 @@
-from collections import defaultdict
+import functools
 import pathlib
 from typing import Dict
 
 
+@functools.lru_cache(maxsize=None)
 def load_role_frame(filename: pathlib.Path) -> Dict:
     """
     Open a dictionary from file, in the format (lemma,frame) -> [roles]
+    The result is cached and shared across model instances, so callers
+    must not mutate it. A plain dict is returned (rather than a read-only
+    view) so that models holding it stay picklable and deep-copyable.
     :param filename: file to read.
     :return: a dictionary.
     """
-    dictionary = defaultdict(list)
+    dictionary = {}
     with open(filename) as file:
-        for l in file:
-            lemma, frame, *v = l.split()
-            dictionary[(lemma, frame)] += v
+        for line in file.read().splitlines():
+            sp = line.split()
+            if sp:
+                dictionary.setdefault((sp[0], sp[1]), []).extend(sp[2:])
     return dictionary
 
 
+@functools.lru_cache(maxsize=None)
 def load_lemma_frame(filename: pathlib.Path) -> Dict:
     """
     Open a dictionary from file, in the format lemma -> [frames]
+    The result is cached and shared across model instances, so callers
+    must not mutate it. A plain dict is returned (rather than a read-only
+    view) so that models holding it stay picklable and deep-copyable.
     :param filename: file to read.
     :return: a dictionary.
     """
-    dictionary = defaultdict(list)
+    dictionary = {}
     with open(filename) as file:
-        for l in file:
-            k, *v = l.split()
-            dictionary[k] += v
+        for line in file.read().splitlines():
+            sp = line.split()
+            if sp:
+                dictionary.setdefault(sp[0], []).extend(sp[1:])
     return dictionary
 
 
+def length_sorted_batches(instances, batch_size: int, key: str = "tokens"):
+    """
+    Group instances into batches of similar length, so that batches reach the
+    model with as little padding as possible. Instances are sorted by the
+    length of the `key` field; each batch is a list of
+    `(original_index, instance)` pairs, so callers can restore the input order
+    of the outputs.
+    :param instances: instances to batch.
+    :param batch_size: maximum number of instances per batch.
+    :param key: name of the sequence field to sort by.
+    :return: a list of batches.
+    """
+    indexed = sorted(enumerate(instances), key=lambda pair: pair[1][key].sequence_length())
+    return [indexed[i : i + batch_size] for i in range(0, len(indexed), batch_size)]
+
+
 def load_label_list(filename: pathlib.Path):
     """
     Load label list from file
     :param filename: file to read.
     :return: a dictionary.
     """
-    label_list = []
     with open(filename) as file:
-        for l in file:
-            label_list.append(l.strip())
-    return label_list
+        return [line.strip() for line in file.read().splitlines()]